@@ -1,14 +1,58 @@
 #!/usr/bin/env python3
-# Dependencies: pipx, git-delta
+# Dependencies: pipx (unless coverage is importable), git-delta (for --format=delta)
+import argparse
+import codecs
+import hashlib
 import json
 import os
-import shutil
+import re
 import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any
+from typing import Optional
+
+CACHE_MAX_AGE = 7 * 24 * 60 * 60
+HUNK_PATTERN = re.compile(r"@@ -\S+ \+(?P<start>\d+)(?:,(?P<count>\d+))? @@")
+
+
+def get_coverage_in_process() -> Optional[dict[Path, set[int]]]:
+    """Analyze the coverage data with the coverage API, if it is importable.
+
+    This produces the same data as the JSON report, without starting pipx
+    and the coverage CLI or serializing the report.
+    """
+    try:
+        import coverage
+        from coverage.exceptions import CoverageException
+        from coverage.report_core import get_analysis_to_report
+    except ImportError:
+        return None
+
+    try:
+        cov = coverage.Coverage()
+        cov.load()
+        branches = cov.get_data().has_arcs()
+        return {
+            Path(reporter.relative_filename()): (
+                # Treat the origin of a missed branch as a missed line.
+                set(analysis.missing)
+                | (set(analysis.missing_branch_arcs()) if branches else set())
+            )
+            for reporter, analysis in get_analysis_to_report(cov, None)
+        }
+    except (AttributeError, TypeError):  # unsupported version of coverage
+        return None
+    except CoverageException:  # e.g. data written by another version
+        return None
 
 
 def get_coverage() -> dict[Path, set[int]]:
+    if (coverage := get_coverage_in_process()) is not None:
+        return coverage
+
     process = subprocess.run(
         ["pipx", "run", "coverage", "json", "--fail-under=0", "-o-"],
         check=True,
@@ -35,10 +79,73 @@ def get_coverage() -> dict[Path, set[int]]:
     }
 
 
-def setup_directories() -> tuple[Path, Path]:
-    tmpdir = Path("/tmp/coverage-blame")  # XXX chosen by fair dice roll
-    shutil.rmtree(tmpdir, ignore_errors=True)
+def parse_diff_path(path: str) -> Path:
+    """Parse the file name in a "+++" line of a diff.
+
+    Git appends a tab to names containing spaces, and quotes names containing
+    control characters, quotes or backslashes, using C escapes.
+    """
+    path = path.removesuffix("\t")
+    if path.startswith('"') and path.endswith('"'):
+        path = codecs.escape_decode(path[1:-1].encode())[0].decode()
+    return Path(path.removeprefix("b/"))
+
+
+def get_changed_lines(rev: str) -> dict[Path, set[int]]:
+    """Return the lines added or modified since a revision, by file."""
+    # Force the default prefixes and the builtin diff, whatever the config says.
+    command = ["git", "-c", "core.quotePath=false", "diff", "--relative"]
+    command += ["--unified=0", "--no-color"]
+    command += ["--no-ext-diff", "--src-prefix=a/", "--dst-prefix=b/", rev, "--"]
+    process = subprocess.run(
+        command,
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+
+    changes: dict[Path, set[int]] = {}
+    lines: set[int] = set()
+    for line in process.stdout.splitlines():
+        if line.startswith("+++ "):
+            lines = set()
+            if line != "+++ /dev/null":
+                changes[parse_diff_path(line.removeprefix("+++ "))] = lines
+        elif match := HUNK_PATTERN.match(line):
+            start, count = int(match["start"]), int(match["count"] or 1)
+            lines.update(range(start, start + count))
+    return changes
+
+
+def restrict_coverage(
+    coverage: dict[Path, set[int]], changes: dict[Path, set[int]]
+) -> dict[Path, set[int]]:
+    return {
+        source: missing & changes[source]
+        for source, missing in coverage.items()
+        if source in changes
+    }
+
+
+def get_cache_dir() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    project = hashlib.sha256(str(Path.cwd()).encode()).hexdigest()[:16]
+    path = Path(cache_home) / "coverage-blame" / project
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def prune_cache(cache: Path) -> None:
+    cutoff = time.time() - CACHE_MAX_AGE
+    for path in cache.iterdir():
+        try:
+            if path.is_file() and path.stat().st_mtime < cutoff:
+                path.unlink()
+        except FileNotFoundError:
+            pass
 
+
+def setup_directories(tmpdir: Path) -> tuple[Path, Path]:
     def mkdir(name: str) -> Path:
         path = tmpdir / name
         path.mkdir(parents=True, exist_ok=True)
@@ -47,16 +154,59 @@ def setup_directories() -> tuple[Path, Path]:
     return mkdir("a"), mkdir("b")
 
 
-def build_tree(coverage: dict[Path, set[int]]) -> tuple[Path, Path]:
-    adir, bdir = setup_directories()
-    for source, missing in coverage.items():
-        apath, bpath = adir / source, bdir / source
-        with apath.open(mode="w") as afile, bpath.open(mode="w") as bfile:
-            with source.open() as io:
-                for number, line in enumerate(io, start=1):
-                    afile.write(line)
-                    if number not in missing:
-                        bfile.write(line)
+def build_file(cache: Path, source: Path, missing: set[int]) -> tuple[Path, Path]:
+    """Return both versions of a source file, reusing them from the cache.
+
+    Entries are keyed by the source path, its mtime and size, and the
+    missing lines. They are written to temporary files and renamed, so
+    concurrent runs never see partial files.
+    """
+    stat = source.stat()
+    key = hashlib.sha256(
+        repr((str(source), stat.st_mtime_ns, stat.st_size, sorted(missing))).encode()
+    ).hexdigest()
+    apath, bpath = cache / f"{key}.a", cache / f"{key}.b"
+
+    if apath.exists() and bpath.exists():
+        os.utime(apath)
+        os.utime(bpath)
+        return apath, bpath
+
+    with (
+        tempfile.NamedTemporaryFile("w", dir=cache, delete=False) as afile,
+        tempfile.NamedTemporaryFile("w", dir=cache, delete=False) as bfile,
+        source.open() as io,
+    ):
+        for number, line in enumerate(io, start=1):
+            afile.write(line)
+            if number not in missing:
+                bfile.write(line)
+
+    os.replace(afile.name, apath)
+    os.replace(bfile.name, bpath)
+    return apath, bpath
+
+
+def build_tree(coverage: dict[Path, set[int]], tmpdir: Path) -> tuple[Path, Path]:
+    """Build both trees from hard links into the cache, skipping covered files."""
+    cache = tmpdir.parent
+    adir, bdir = setup_directories(tmpdir)
+
+    def link(entry: Path, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.link(entry, path)
+
+    def build(source: Path, missing: set[int]) -> None:
+        apath, bpath = build_file(cache, source, missing)
+        link(apath, adir / source)
+        link(bpath, bdir / source)
+
+    uncovered = [(source, missing) for source, missing in coverage.items() if missing]
+    with ThreadPoolExecutor() as executor:
+        for future in [executor.submit(build, *item) for item in uncovered]:
+            future.result()
+
+    prune_cache(cache)
     return adir, bdir
 
 
@@ -74,10 +224,86 @@ def format_blame(adir: Path, bdir: Path) -> None:
     )
 
 
+def collapse(lines: set[int]) -> list[tuple[int, int]]:
+    """Collapse line numbers into ranges of consecutive lines."""
+    ranges: list[tuple[int, int]] = []
+    for number in sorted(lines):
+        if ranges and ranges[-1][1] == number - 1:
+            ranges[-1] = (ranges[-1][0], number)
+        else:
+            ranges.append((number, number))
+    return ranges
+
+
+def format_ranges(ranges: list[tuple[int, int]]) -> str:
+    return ", ".join(
+        str(start) if start == end else f"{start}-{end}" for start, end in ranges
+    )
+
+
+def print_text(coverage: dict[Path, set[int]]) -> None:
+    """Print the missing lines of each source, read once and in order."""
+    bold, red, reset = ("\033[1m", "\033[31m", "\033[0m")
+    if not sys.stdout.isatty():
+        bold = red = reset = ""
+
+    for source, missing in sorted(coverage.items()):
+        if not missing:
+            continue
+
+        print(f"{bold}{source}: {format_ranges(collapse(missing))}{reset}")
+        last, previous = max(missing), 0
+        with source.open() as io:
+            for number, line in enumerate(io, start=1):
+                if number in missing:
+                    if previous and previous != number - 1:
+                        print(f"{'⋮':>6}")
+                    print(f"{number:>6} {red}{line.rstrip()}{reset}")
+                    previous = number
+                if number == last:
+                    break
+        print()
+
+
+def print_json(coverage: dict[Path, set[int]]) -> None:
+    for source, missing in sorted(coverage.items()):
+        if missing:
+            print(json.dumps({"file": str(source), "missing": collapse(missing)}))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--format",
+        choices=["delta", "text", "json"],
+        default="delta",
+        help="render with delta, as plain text, or as JSON lines of line ranges",
+    )
+    parser.add_argument(
+        "--since",
+        metavar="REV",
+        help="only show missing lines in hunks changed since REV",
+    )
+    return parser.parse_args()
+
+
 def main() -> None:
+    args = parse_args()
     coverage = get_coverage()
-    adir, bdir = build_tree(coverage)
-    format_blame(adir, bdir)
+    if args.since:
+        coverage = restrict_coverage(coverage, get_changed_lines(args.since))
+
+    if args.format == "text":
+        print_text(coverage)
+        return
+
+    if args.format == "json":
+        print_json(coverage)
+        return
+
+    with tempfile.TemporaryDirectory(dir=get_cache_dir()) as tmpdir:
+        adir, bdir = build_tree(coverage, Path(tmpdir))
+        format_blame(adir, bdir)
 
 
 if __name__ == "__main__":
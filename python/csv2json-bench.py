@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Measure csv2json throughput in rows per second for both directions.
+
+Output goes to a pipe drained by another thread, or to a temporary file, so
+that the cost of each write system call shows up in the results.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import csv2json  # noqa: E402
+
+COLUMNS = ["id", "name", "email", "amount", "comment"]
+
+
+def generate_csv(rows: int) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for n in range(rows):
+        writer.writerow(
+            [n, f"user{n}", f"user{n}@example.com", n * 1.5, "lorem, ipsum"]
+        )
+    return buffer.getvalue()
+
+
+def generate_json(rows: int) -> str:
+    return "".join(
+        json.dumps(dict(zip(COLUMNS, row))) + "\n"
+        for row in csv.reader(io.StringIO(generate_csv(rows)))
+        if row != COLUMNS
+    )
+
+
+@contextmanager
+def open_pipe():
+    """Yield the write end of a pipe whose read end is drained by a thread."""
+    read_fd, write_fd = os.pipe()
+
+    def drain() -> None:
+        with open(read_fd, "rb", buffering=0) as reader:
+            while reader.read(1 << 16):
+                pass
+
+    thread = threading.Thread(target=drain)
+    thread.start()
+    try:
+        with open(write_fd, "w") as writer:
+            yield writer
+    finally:
+        thread.join()
+
+
+def open_target(target: str):
+    return open_pipe() if target == "pipe" else tempfile.TemporaryFile("w")
+
+
+def measure(convert, text: str, count: int, target: str, **policy) -> float:
+    with open_target(target) as file:
+        output = csv2json.Output(file, **policy)
+        start = time.perf_counter()
+        convert(io.StringIO(text), output)
+        output.flush()
+        return count / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", "-n", type=int, default=200_000)
+    parser.add_argument("--target", choices=["pipe", "file"], default="pipe")
+    args = parser.parse_args()
+
+    inputs = {
+        "json": (csv2json.to_json, generate_csv(args.rows)),
+        "csv": (csv2json.from_json, generate_json(args.rows)),
+    }
+    policies = {
+        "per-row": {"rows": 1},
+        "buffered": {},
+    }
+
+    for format, (convert, text) in inputs.items():
+        for name, policy in policies.items():
+            rate = measure(convert, text, args.rows, args.target, **policy)
+            print(f"--format={format:<4} {name:<8} {rate:>12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,23 +2,427 @@
 """Convert between CSV and JSON Lines."""
 import argparse
 import csv
+import datetime
+import io
 import json
+import math
+import mmap
+import os
+import re
+import struct
 import sys
-from typing import TextIO
+import tempfile
+import threading
+from array import array
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import chain, islice
+from typing import Any, Optional, TextIO
 
+DEFAULT_FLUSH_SIZE = 1 << 20
+CHUNK_SIZE = 16 << 20
+INDEX_SUFFIX = ".csv2json-index"
+INDEX_HEADER = struct.Struct("<8sQQI")
+INDEX_MAGIC = b"csv2json"
+INDEX_STRIDE = 256
+SAMPLE_SIZE = 1000
+INT_PATTERN = re.compile(r"-?(0|[1-9][0-9]*)")
+FLOAT_PATTERN = re.compile(r"-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?")
+DATETIME_PATTERN = re.compile(
+    r"[0-9]{4}-[0-9]{2}-[0-9]{2}"
+    r"([T ][0-9]{2}:[0-9]{2}(:[0-9]{2}(\.[0-9]+)?)?(Z|[-+][0-9]{2}:[0-9]{2})?)?"
+)
 
-def to_json(source: TextIO, target: TextIO) -> None:
-    for data in csv.DictReader(source):
-        print(json.dumps(data), file=target, flush=True)
 
+class Output:
+    """Buffer writes to a stream and flush them in large chunks.
 
-def from_json(source: TextIO, target: TextIO) -> None:
-    class Target:
-        def write(self, s: str):
-            target.write(s)
-            target.flush()
+    Every call to `write` is counted as one record unless told otherwise.
+    The buffer is flushed once it holds `rows` records or `size` characters,
+    whichever comes first. With an `interval`, a timer also flushes the
+    buffer at most `interval` seconds after its first write, so the tail of
+    a burst is not held back while the input is idle.
+    """
 
-    writer = csv.writer(Target())
+    def __init__(
+        self,
+        target: TextIO,
+        *,
+        rows: Optional[int] = None,
+        size: Optional[int] = DEFAULT_FLUSH_SIZE,
+        interval: Optional[float] = None,
+    ) -> None:
+        self.target = target
+        self.rows = rows
+        self.size = size
+        self.interval = interval
+        self.buffer: list[str] = []
+        self.buffered = 0
+        self.records = 0
+        self.lock = threading.Lock()
+        self.timer: Optional[threading.Timer] = None
+
+    def write(self, s: str, records: int = 1) -> None:
+        with self.lock:
+            self.buffer.append(s)
+            self.buffered += len(s)
+            self.records += records
+            if (self.rows is not None and self.records >= self.rows) or (
+                self.size is not None and self.buffered >= self.size
+            ):
+                self._flush()
+            elif self.interval is not None and self.timer is None:
+                self.timer = threading.Timer(self.interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self) -> None:
+        with self.lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.buffer:
+            self.target.write("".join(self.buffer))
+            self.buffer.clear()
+            self.buffered = 0
+            self.records = 0
+        self.target.flush()
+
+
+def to_json(source: TextIO, target: Output, infer: bool = False) -> None:
+    records: Iterator[dict[str, Any]] = csv.DictReader(source)
+    if infer:
+        records = typed(records)
+    write_json(records, target)
+
+
+def write_json(records: Iterable[dict[str, Any]], target: Output) -> None:
+    encode = json.JSONEncoder().encode
+    write = target.write
+    for data in records:
+        write(encode(data) + "\n")
+
+
+def parse_bool(value: str) -> bool:
+    if (lowered := value.lower()) in ("true", "false"):
+        return lowered == "true"
+    raise ValueError(value)
+
+
+def parse_int(value: str) -> int:
+    if not INT_PATTERN.fullmatch(value):
+        raise ValueError(value)
+    return int(value)
+
+
+def parse_float(value: str) -> float:
+    if not FLOAT_PATTERN.fullmatch(value) or not math.isfinite(number := float(value)):
+        raise ValueError(value)
+    return number
+
+
+def parse_datetime(value: str) -> str:
+    """Validate an ISO 8601 date or datetime, and keep it as it is.
+
+    JSON has no datetime type, so the value is not normalized.
+    """
+    if not DATETIME_PATTERN.fullmatch(value):
+        raise ValueError(value)
+    try:
+        datetime.date.fromisoformat(value)
+    except ValueError:
+        datetime.datetime.fromisoformat(value)
+    return value
+
+
+# Candidate column types, from the most to the least specific.
+PARSERS: dict[str, Callable[[str], Any]] = {
+    "bool": parse_bool,
+    "int": parse_int,
+    "float": parse_float,
+    "datetime": parse_datetime,
+    "str": str,
+}
+
+
+def infer_types(sample: list[dict[str, Any]]) -> dict[str, str]:
+    """Return the most specific type that fits every value of each column.
+
+    Empty values fit any type. Columns without values have the type `null`.
+    """
+    types = {}
+    for key in dict.fromkeys(key for data in sample for key in data):
+        if key is None:
+            continue
+        values = {data.get(key) for data in sample} - {"", None}
+        if not values:
+            types[key] = "null"
+            continue
+        for name, parse in PARSERS.items():
+            try:
+                for value in values:
+                    parse(value)
+            except (TypeError, ValueError):
+                continue
+            types[key] = name
+            break
+    return types
+
+
+def compile_converter(name: str) -> Callable[[Any], Any]:
+    """Return a converter for a column type that never guesses.
+
+    Empty and missing values become null. Values that don't parse as the column type,
+    because they were not in the sample, are kept as strings.
+    """
+    if name == "null":
+        return lambda value: None if value in ("", None) else value
+
+    parse = PARSERS[name]
+
+    def convert(value: Any) -> Any:
+        if value in ("", None):
+            return None
+        try:
+            return parse(value)
+        except (TypeError, ValueError):
+            return value
+
+    return convert
+
+
+def convert_records(
+    records: Iterable[dict[str, Any]], types: dict[str, str]
+) -> Iterator[dict[str, Any]]:
+    converters = {key: compile_converter(name) for key, name in types.items()}
+    for data in records:
+        yield {
+            key: converters[key](value) if key in converters else value
+            for key, value in data.items()
+        }
+
+
+def typed(records: Iterator[dict[str, Any]]) -> Iterator[dict[str, Any]]:
+    """Infer column types from the first records and convert all records."""
+    sample = list(islice(records, SAMPLE_SIZE))
+    return convert_records(chain(sample, records), infer_types(sample))
+
+
+def split_records(path: str, chunk_size: int) -> Iterator[tuple[int, int]]:
+    """Yield byte ranges of roughly `chunk_size` that end on record boundaries.
+
+    The first range holds the header. A newline ends a record only if it is
+    preceded by an even number of double quotes, since escaped quotes come
+    in pairs.
+    """
+    with open(path, "rb") as file:
+        if not (size := os.fstat(file.fileno()).st_size):
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            position, quoted = 0, False
+
+            def boundary(start: int) -> int:
+                nonlocal position, quoted
+                quoted ^= bool(data[position:start].count(b'"') & 1)
+                position = start
+                while (newline := data.find(b"\n", position)) != -1:
+                    quoted ^= bool(data[position:newline].count(b'"') & 1)
+                    position = newline + 1
+                    if not quoted:
+                        return position
+                position = size
+                return size
+
+            start = 0
+            end = boundary(0)
+            while start < size:
+                yield start, end
+                start = end
+                if start + chunk_size < size:
+                    end = boundary(start + chunk_size)
+                else:
+                    end = size
+
+
+def build_index(path: str) -> array:
+    """Return the byte offsets of every `INDEX_STRIDE`-th record.
+
+    Empty lines are skipped like `csv.DictReader` does, so the offsets line
+    up with the records it yields. The first entry is the end of the header.
+    """
+    offsets = array("Q")
+    position, quoted, records = 0, False, -1
+    with open(path, "rb") as file:
+        for line in file:
+            position += len(line)
+            if not quoted and line in (b"\n", b"\r\n"):
+                continue
+            quoted ^= bool(line.count(b'"') & 1)
+            if not quoted:
+                records += 1
+                if records % INDEX_STRIDE == 0:
+                    offsets.append(position)
+    return offsets
+
+
+def load_index(path: str) -> Optional[array]:
+    """Read the sidecar index, unless it is missing or out of date."""
+    stat = os.stat(path)
+    try:
+        with open(path + INDEX_SUFFIX, "rb") as file:
+            magic, size, mtime, stride = INDEX_HEADER.unpack(
+                file.read(INDEX_HEADER.size)
+            )
+            if (magic, size, mtime, stride) != (
+                INDEX_MAGIC,
+                stat.st_size,
+                stat.st_mtime_ns,
+                INDEX_STRIDE,
+            ):
+                return None
+            offsets = array("Q")
+            offsets.frombytes(file.read())
+            return offsets
+    except (OSError, struct.error, ValueError):
+        return None
+
+
+def save_index(path: str, offsets: array) -> None:
+    stat = os.stat(path)
+    header = INDEX_HEADER.pack(
+        INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, INDEX_STRIDE
+    )
+    try:
+        with open(path + INDEX_SUFFIX, "wb") as file:
+            file.write(header)
+            offsets.tofile(file)
+    except OSError:
+        pass
+
+
+def get_index(path: str) -> array:
+    if (offsets := load_index(path)) is None:
+        offsets = build_index(path)
+        save_index(path, offsets)
+    return offsets
+
+
+def index_ranges(
+    offsets: array, size: int, chunk_size: int
+) -> Iterator[tuple[int, int]]:
+    """Yield the header range and data ranges of roughly `chunk_size` bytes."""
+    if not offsets:
+        yield 0, size
+        return
+
+    yield 0, offsets[0]
+    start = offsets[0]
+    for offset in offsets:
+        if offset - start >= chunk_size:
+            yield start, offset
+            start = offset
+    if start < size:
+        yield start, size
+
+
+def read_chunk(path: str, encoding: str, start: int, end: int) -> TextIO:
+    with open(path, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start)
+    return io.TextIOWrapper(io.BytesIO(data), encoding)
+
+
+def convert_chunk(
+    path: str,
+    encoding: str,
+    fieldnames: list[str],
+    types: Optional[dict[str, str]],
+    start: int,
+    end: int,
+) -> tuple[str, int]:
+    encode = json.JSONEncoder().encode
+    records: Iterable[dict[str, Any]] = csv.DictReader(
+        read_chunk(path, encoding, start, end), fieldnames
+    )
+    if types is not None:
+        records = convert_records(records, types)
+    lines = [encode(data) + "\n" for data in records]
+    return "".join(lines), len(lines)
+
+
+def to_json_parallel(
+    source: TextIO, target: Output, jobs: int, infer: bool = False
+) -> None:
+    """Convert a CSV file in chunks across a process pool, preserving order."""
+    path, encoding = source.name, source.encoding
+    if (offsets := load_index(path)) is not None:
+        ranges = index_ranges(offsets, os.stat(path).st_size, CHUNK_SIZE)
+    else:
+        ranges = split_records(path, CHUNK_SIZE)
+    if (header := next(ranges, None)) is None:
+        return
+
+    fieldnames = next(csv.reader(read_chunk(path, encoding, *header)), [])
+
+    types = None
+    if infer:
+        with open(path, encoding=encoding) as file:
+            types = infer_types(list(islice(csv.DictReader(file), SAMPLE_SIZE)))
+
+    with ProcessPoolExecutor(jobs) as executor:
+        pending: deque[Future[tuple[str, int]]] = deque()
+        for start, end in ranges:
+            pending.append(
+                executor.submit(
+                    convert_chunk, path, encoding, fieldnames, types, start, end
+                )
+            )
+            if len(pending) > 2 * jobs:
+                target.write(*pending.popleft().result())
+        while pending:
+            target.write(*pending.popleft().result())
+
+
+def to_json_slice(
+    source: TextIO,
+    target: Output,
+    start: int,
+    stop: Optional[int],
+    infer: bool = False,
+) -> None:
+    """Convert the records from `start` up to `stop`.
+
+    For files, a sidecar index of record offsets is used to seek close to
+    `start` instead of parsing every record before it.
+    """
+    if source is sys.stdin:
+        records: Iterator[dict[str, Any]] = islice(
+            csv.DictReader(source), start, stop
+        )
+        write_json(typed(records) if infer else records, target)
+        return
+
+    path, encoding = source.name, source.encoding
+    if not (offsets := get_index(path)):
+        return
+
+    fieldnames = next(csv.reader(read_chunk(path, encoding, 0, offsets[0])))
+    block = min(start // INDEX_STRIDE, len(offsets) - 1)
+    base = block * INDEX_STRIDE
+    with open(path, "rb") as file:
+        file.seek(offsets[block])
+        reader = csv.DictReader(io.TextIOWrapper(file, encoding), fieldnames)
+        records = islice(reader, start - base, None if stop is None else stop - base)
+        write_json(typed(records) if infer else records, target)
+
+
+def from_json(source: TextIO, target: Output) -> None:
+    writer = csv.writer(target)
     keys = None
     for line in source:
         data = json.loads(line)
@@ -29,6 +433,43 @@ def from_json(source: TextIO, target: TextIO) -> None:
         writer.writerow([data.get(key) for key in keys])
 
 
+def from_json_union(source: TextIO, target: Output) -> None:
+    """Convert to CSV with a header made of the keys of all records.
+
+    Records are spooled to a temporary file with the columns known so far.
+    Since columns are only ever appended, shorter rows are padded when the
+    spool is copied to the output, so memory depends on the number of
+    columns, not rows.
+    """
+    keys: dict[str, None] = {}
+    with tempfile.TemporaryFile("w+", newline="") as spool:
+        writer = csv.writer(spool)
+        for line in source:
+            data = json.loads(line)
+            keys.update(dict.fromkeys(data))
+            writer.writerow([data.get(key) for key in keys])
+
+        spool.seek(0)
+        writer = csv.writer(target)
+        writer.writerow(keys)
+        padding = [""] * len(keys)
+        for row in csv.reader(spool):
+            writer.writerow(row + padding[len(row) :])
+
+
+def parse_rows(value: str) -> tuple[int, Optional[int]]:
+    start, sep, stop = value.partition(":")
+    try:
+        if not sep:
+            raise ValueError(value)
+        rows = int(start or 0), int(stop) if stop else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid range: {value}") from None
+    if rows[0] < 0 or (rows[1] is not None and rows[1] < rows[0]):
+        raise argparse.ArgumentTypeError(f"invalid range: {value}")
+    return rows
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument(
@@ -42,14 +483,80 @@ def main() -> None:
     parser.add_argument(
         "--output", "-o", type=argparse.FileType("w"), default=sys.stdout
     )
+    parser.add_argument(
+        "--flush-rows",
+        type=int,
+        metavar="N",
+        help="flush output after N records (default: 1 on a terminal)",
+    )
+    parser.add_argument(
+        "--flush-size",
+        type=int,
+        default=DEFAULT_FLUSH_SIZE,
+        metavar="N",
+        help=f"flush output after N characters (default: {DEFAULT_FLUSH_SIZE})",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        metavar="SECONDS",
+        help="flush buffered output at most SECONDS after it was written",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        metavar="N",
+        help="convert CSV files using N processes",
+    )
+    parser.add_argument(
+        "--union",
+        action="store_true",
+        help="with --format=csv, include the keys of all records in the header",
+    )
+    parser.add_argument(
+        "--rows",
+        type=parse_rows,
+        metavar="START:END",
+        help="convert only the records from START up to END (zero-based)",
+    )
+    parser.add_argument(
+        "--infer-types",
+        action="store_true",
+        help="convert columns to numbers, booleans and nulls based on a sample",
+    )
     args = parser.parse_args()
 
-    if args.format == "json":
-        to_json(args.infile, args.output)
-    elif args.format == "csv":
-        from_json(args.infile, args.output)
-    else:
-        sys.exit(f"unknown format: {args.format}")
+    if args.rows is not None and (args.format != "json" or args.jobs > 1):
+        parser.error("--rows requires --format=json and cannot be used with --jobs")
+
+    if args.jobs > 1 and (args.format != "json" or args.infile is sys.stdin):
+        parser.error("--jobs requires --format=json and an input file")
+
+    rows = args.flush_rows
+    if rows is None and args.output.isatty():
+        rows = 1
+
+    output = Output(
+        args.output, rows=rows, size=args.flush_size, interval=args.flush_interval
+    )
+
+    try:
+        if args.format == "json" and args.rows is not None:
+            to_json_slice(args.infile, output, *args.rows, args.infer_types)
+        elif args.format == "json" and args.jobs > 1:
+            to_json_parallel(args.infile, output, args.jobs, args.infer_types)
+        elif args.format == "json":
+            to_json(args.infile, output, args.infer_types)
+        elif args.format == "csv" and args.union:
+            from_json_union(args.infile, output)
+        elif args.format == "csv":
+            from_json(args.infile, output)
+        else:
+            sys.exit(f"unknown format: {args.format}")
+    finally:
+        output.flush()
 
 
 if __name__ == "__main__":
@@ -1,24 +1,37 @@
 """Plot the timeseries data from a git repository."""
-import matplotlib.pyplot as plt
-from matplotlib.dates import DateFormatter
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
 
+SPARKS = "▁▂▃▄▅▆▇█"
 
-def truncate_to_week(timestamp: datetime.datetime) -> datetime.datetime:
-    year, week, _ = timestamp.isocalendar()
-    return timestamp.fromisocalendar(year, week, 1)
 
+def truncate_to_week(date: datetime.date) -> datetime.date:
+    return date - datetime.timedelta(days=date.weekday())
 
-def truncate_to_month(timestamp: datetime.datetime) -> datetime.datetime:
-    return datetime.datetime(timestamp.year, timestamp.month, 1)
 
+def truncate_to_month(date: datetime.date) -> datetime.date:
+    return date.replace(day=1)
 
-def truncate_to_day(timestamp: datetime.datetime) -> datetime.datetime:
-    return datetime.datetime(timestamp.year, timestamp.month, timestamp.day)
+
+def truncate_to_day(date: datetime.date) -> datetime.date:
+    return date
 
 
 def create_truncate(
     args: argparse.Namespace,
-) -> tuple[Callable[[datetime.datetime], datetime.datetime], int]:
+) -> tuple[Callable[[datetime.date], datetime.date], int]:
     if args.month:
         return truncate_to_month, 30
 
@@ -28,52 +41,368 @@ def create_truncate(
     return truncate_to_day, 1
 
 
-def read_series() -> list[datetime.datetime]:
+def git(repository: Path, *args: str) -> str:
     process = subprocess.run(
-        ["git", "log", "--format=%at"], check=True, text=True, capture_output=True
+        ["git", "-C", str(repository), *args],
+        check=True,
+        text=True,
+        capture_output=True,
     )
-    return [
-        datetime.datetime.fromtimestamp(int(line))
-        for line in process.stdout.splitlines()
+    return process.stdout.strip()
+
+
+def get_toplevel(path: Path) -> Optional[Path]:
+    """Return the work tree or bare repository containing a path, if any."""
+    try:
+        output = git(path, "rev-parse", "--is-bare-repository", "--absolute-git-dir")
+        bare, gitdir = output.splitlines()
+        if bare == "true":
+            return Path(gitdir).resolve()
+        return Path(git(path, "rev-parse", "--show-toplevel")).resolve()
+    except (subprocess.CalledProcessError, ValueError):
+        return None
+
+
+def is_repository(path: Path) -> bool:
+    """Return True if the path is the top of a work tree or a bare repository."""
+    return get_toplevel(path) == path.resolve()
+
+
+def find_repositories(paths: list[Path]) -> list[Path]:
+    """Return the repositories, expanding directories that contain repositories.
+
+    A directory inside a work tree stands for that repository, unless it
+    contains repositories of its own.
+    """
+    repositories = []
+    for path in paths:
+        toplevel = get_toplevel(path)
+        if toplevel is not None and toplevel == path.resolve():
+            repositories.append(path)
+            continue
+
+        children = []
+        if path.is_dir():
+            children = [
+                child
+                for child in sorted(path.iterdir())
+                if child.is_dir() and is_repository(child)
+            ]
+
+        if children:
+            repositories.extend(children)
+        elif toplevel is not None:
+            repositories.append(path)
+    return repositories
+
+
+def label_repositories(repositories: Iterable[Path]) -> dict[Path, str]:
+    """Label repositories by name, or by relative path if names are ambiguous.
+
+    Ambiguous paths are made relative to the common parent of all
+    repositories.
+    """
+    resolved = {repository: repository.resolve() for repository in repositories}
+    if not resolved:
+        return {}
+
+    names = Counter(path.name for path in resolved.values())
+    parent = Path(os.path.commonpath(list(resolved.values())))
+    return {
+        repository: (
+            path.name if names[path.name] == 1 else str(path.relative_to(parent))
+        )
+        for repository, path in resolved.items()
+    }
+
+
+def read_series(repository: Path, *revisions: str) -> dict[datetime.date, int]:
+    """Count commits per day in local time, streaming the output of git log.
+
+    Git formats the commit dates, so lines are counted as they arrive and
+    only one date object is created per distinct day.
+    """
+    command = [
+        "git",
+        "-C",
+        str(repository),
+        "log",
+        "--format=%ad",
+        "--date=format-local:%Y-%m-%d",
+        *revisions,
+        "--",
     ]
+    with subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    ) as process:
+        counts = Counter(process.stdout)
+        stderr = process.stderr.read()
+
+    if process.returncode:
+        raise subprocess.CalledProcessError(
+            process.returncode, command, stderr=stderr
+        )
+
+    return {
+        datetime.date.fromisoformat(day.rstrip()): count
+        for day, count in counts.items()
+    }
+
+
+def get_cache_path(repository: Path) -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    gitdir = git(repository, "rev-parse", "--absolute-git-dir")
+    key = hashlib.sha256(gitdir.encode()).hexdigest()[:16]
+    return Path(cache_home) / "git-timeseries" / f"{key}.json"
+
+
+def is_ancestor(repository: Path, commit: str, head: str) -> bool:
+    command = ["git", "-C", str(repository), "merge-base", "--is-ancestor"]
+    command += [commit, head]
+    return subprocess.run(command, capture_output=True).returncode == 0
+
+
+def read_cached_series(repository: Path) -> dict[datetime.date, int]:
+    """Count commits per day, walking only the commits added since the last run.
+
+    The cache holds the daily counts and the commit they were computed for.
+    If that commit is no longer an ancestor of HEAD, because history was
+    rewritten, or the local timezone changed, the counts are rebuilt.
+    """
+    path = get_cache_path(repository)
+    head = git(repository, "rev-parse", "HEAD")
+    timezone = repr(time.tzname)
+
+    try:
+        cache = json.loads(path.read_text())
+    except (OSError, ValueError):
+        cache = {}
+
+    series: dict[datetime.date, int] = {}
+    revisions = [head]
+    if cache.get("timezone") == timezone and "head" in cache:
+        if cache["head"] == head or is_ancestor(repository, cache["head"], head):
+            series = {
+                datetime.date.fromisoformat(day): count
+                for day, count in cache["days"].items()
+            }
+            revisions = [f"{cache['head']}..{head}"]
+
+    if cache.get("head") != head or not series:
+        for date, count in read_series(repository, *revisions).items():
+            series[date] = series.get(date, 0) + count
+
+        cache = {
+            "head": head,
+            "timezone": timezone,
+            "days": {date.isoformat(): count for date, count in series.items()},
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=path.parent, delete=False) as io:
+            json.dump(cache, io)
+        os.replace(io.name, path)
+
+    return series
 
 
 def aggregate_series(
-    series: list[datetime.datetime],
-    truncate: Callable[[datetime.datetime], datetime.datetime],
-) -> dict[datetime.datetime, int]:
+    series: dict[datetime.date, int],
+    truncate: Callable[[datetime.date], datetime.date],
+) -> dict[datetime.date, int]:
     data = defaultdict(int)
-    for timestamp in series:
-        data[truncate(timestamp)] += 1
+    for date, count in series.items():
+        data[truncate(date)] += count
+    return data
+
+
+def read_repositories(
+    repositories: list[Path], jobs: int, cache: bool
+) -> dict[Path, dict[datetime.date, int]]:
+    """Count commits per day in each repository, reading them concurrently.
+
+    Repositories that cannot be read, such as empty ones, are reported on
+    stderr and left out.
+    """
+    read = read_cached_series if cache else read_series
+    datasets = {}
+    with ThreadPoolExecutor(jobs) as executor:
+        futures = [executor.submit(read, repository) for repository in repositories]
+        for repository, future in zip(repositories, futures):
+            try:
+                datasets[repository] = future.result()
+            except subprocess.CalledProcessError as error:
+                message = (error.stderr or "").strip() or error
+                print(f"{repository}: {message}", file=sys.stderr)
+    return datasets
+
+
+def merge_series(
+    datasets: Iterable[dict[datetime.date, int]],
+) -> dict[datetime.date, int]:
+    data: dict[datetime.date, int] = defaultdict(int)
+    for series in datasets:
+        for date, count in series.items():
+            data[date] += count
     return data
 
 
-def plot_series(data: dict[datetime.datetime, int], width: int) -> None:
+def plot_stacked(
+    datasets: dict[str, dict[datetime.date, int]],
+    width: int,
+    output: Optional[Path] = None,
+) -> None:
+    """Plot the series as stacked bars, and show or save the figure."""
+    import matplotlib
+
+    if output is not None:
+        matplotlib.use("Agg")
+
+    import matplotlib.pyplot as plt
+    from matplotlib.dates import DateFormatter
+
     formatter = DateFormatter("%Y-%m-%d")
+    dates = sorted(set().union(*datasets.values()))
+    bottom = [0] * len(dates)
 
-    plt.bar(data.keys(), data.values(), width=width)
+    for label, data in datasets.items():
+        heights = [data.get(date, 0) for date in dates]
+        plt.bar(dates, heights, width=width, bottom=bottom, label=label or None)
+        bottom = [a + b for a, b in zip(bottom, heights)]
+
+    if len(datasets) > 1:
+        plt.legend()
     plt.gcf().autofmt_xdate()
     plt.gca().xaxis.set_major_formatter(formatter)
-    plt.show()
+
+    if output is not None:
+        plt.savefig(output)
+    else:
+        plt.show()
+
+
+def print_table(datasets: dict[str, dict[datetime.date, int]], sep: str) -> None:
+    """Print one row per bucket, with a column for each series."""
+    dates = sorted(set().union(*datasets.values()))
+    labels = [label or "commits" for label in datasets]
+    if sep:
+        print(sep.join(["date", *labels]))
+    else:
+        print("date      ", *(f"{label:>8}" for label in labels))
+
+    for date in dates:
+        counts = [str(data.get(date, 0)) for data in datasets.values()]
+        if sep:
+            print(sep.join([date.isoformat(), *counts]))
+        else:
+            print(date.isoformat(), *(f"{count:>8}" for count in counts))
+
+
+def sparkline(values: list[int]) -> str:
+    top = max(values, default=0) or 1
+    return "".join(SPARKS[round(value / top * (len(SPARKS) - 1))] for value in values)
+
+
+def print_sparklines(
+    datasets: dict[str, dict[datetime.date, int]],
+    truncate: Callable[[datetime.date], datetime.date],
+) -> None:
+    """Print a sparkline per series, with empty buckets shown as zero."""
+    dates = sorted(set().union(*datasets.values()))
+    if not dates:
+        return
+
+    days = (dates[-1] - dates[0]).days
+    buckets = dict.fromkeys(
+        truncate(dates[0] + datetime.timedelta(days=n)) for n in range(days + 1)
+    )
+    for label, data in datasets.items():
+        line = sparkline([data.get(bucket, 0) for bucket in buckets])
+        prefix = f"{label}: " if label else ""
+        print(f"{prefix}{dates[0]} {line} {dates[-1]}")
 
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description=__doc__.strip())
 
+    parser.add_argument(
+        "repositories",
+        nargs="*",
+        type=Path,
+        default=[Path()],
+        metavar="repository",
+        help="repositories, or directories containing repositories",
+    )
     parser.add_argument("--week", "-w", action="store_true")
     parser.add_argument("--month", "-m", action="store_true")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="walk the entire history instead of updating the cached counts",
+    )
+    parser.add_argument(
+        "--stack",
+        action="store_true",
+        help="stack the counts of each repository instead of summing them",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=8,
+        metavar="N",
+        help="read up to N repositories concurrently",
+    )
+    parser.add_argument(
+        "--format",
+        "-f",
+        choices=["plot", "table", "csv", "sparkline"],
+        default="plot",
+        help="plot the series, or print them as a table, CSV or sparklines",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        type=Path,
+        metavar="FILE",
+        help="save the plot to FILE (e.g. PNG or SVG) instead of showing it",
+    )
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.output is not None and args.format != "plot":
+        parser.error("--output requires --format=plot")
+    return args
 
 
 def main() -> None:
     args = parse_args()
 
     truncate, width = create_truncate(args)
-    series = read_series()
-    data = aggregate_series(series, truncate)
+    repositories = find_repositories(args.repositories)
+    if not repositories:
+        sys.exit("error: no git repositories found")
+
+    datasets = read_repositories(repositories, args.jobs, not args.no_cache)
+
+    if args.stack:
+        labels = label_repositories(datasets)
+        data = {
+            labels[repository]: aggregate_series(series, truncate)
+            for repository, series in datasets.items()
+        }
+    else:
+        data = {"": aggregate_series(merge_series(datasets.values()), truncate)}
+
+    if args.format == "table":
+        print_table(data, sep="")
+    elif args.format == "csv":
+        print_table(data, sep=",")
+    elif args.format == "sparkline":
+        print_sparklines(data, truncate)
+    else:
+        plot_stacked(data, width, args.output)
 
-    plot_series(data, width)
+    if len(datasets) < len(repositories):
+        sys.exit(1)
 
 
 __pyproject__ = """
@@ -1,18 +1,61 @@
 import argparse
 import builtins
 import json
+import os
 import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 
 import gspread
+import requests
+from gspread.exceptions import GSpreadException
+from gspread.utils import absolute_range_name, extract_id_from_url
 from oauth2client.service_account import ServiceAccountCredentials
 
+BATCH_SIZE = 100
+CACHE_TTL = 24 * 60 * 60
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
     parser.add_argument("--credentials", "-f")
     parser.add_argument("--path", "-p", dest="paths", action="append")
-    parser.add_argument("location")
-    return parser.parse_args()
+    parser.add_argument(
+        "--api-url",
+        help="send unauthenticated API requests to this URL, e.g. a local stand-in",
+    )
+    parser.add_argument(
+        "--file",
+        "-F",
+        type=argparse.FileType("r"),
+        help="read spreadsheet URLs from this file, one per line",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=8,
+        help="fetch up to this many spreadsheets concurrently",
+    )
+    parser.add_argument(
+        "--ttl",
+        type=float,
+        default=CACHE_TTL,
+        help="reuse cached cells for up to this many seconds (default: one day)",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="ignore cached cells and fetch everything again",
+    )
+    parser.add_argument("locations", nargs="*", metavar="location")
+    args = parser.parse_args()
+    if not args.locations and args.file is None:
+        parser.error("no spreadsheets given, pass URLs or --file")
+    return args
 
 
 def parse_path(path: str) -> tuple[re.Pattern[str], str]:
@@ -23,30 +66,184 @@ def parse_path(path: str) -> tuple[re.Pattern[str], str]:
     return pattern, path, type
 
 
-def main() -> None:
-    args = parse_args()
-    paths = [parse_path(path) for path in args.paths]
+class RedirectSession(requests.Session):
+    """Send Google API requests to another base URL."""
+
+    def __init__(self, base_url: str) -> None:
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+
+    def request(self, method, url, *args, **kwargs):
+        url = re.sub(r"^https://[^/]+\.googleapis\.com", self.base_url, url)
+        return super().request(method, url, *args, **kwargs)
+
+
+def authorize(args: argparse.Namespace) -> gspread.Client:
+    """Authorize once, with a session shared by all worker threads.
+
+    Requests that hit the rate limit are retried with exponential backoff.
+    """
+    if args.api_url:
+        client = gspread.authorize(
+            None,
+            http_client=gspread.BackOffHTTPClient,
+            session=RedirectSession(args.api_url),
+        )
+    else:
+        client = authorize_service_account(args.credentials)
+
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=args.jobs)
+    client.http_client.session.mount("https://", adapter)
+    client.http_client.session.mount("http://", adapter)
+    return client
+
+
+def authorize_service_account(keyfile: str) -> gspread.Client:
     credentials = ServiceAccountCredentials.from_json_keyfile_name(
-        args.credentials,
+        keyfile,
         [
             "https://spreadsheets.google.com/feeds",
             "https://www.googleapis.com/auth/drive",
         ],
     )
+    return gspread.authorize(credentials, http_client=gspread.BackOffHTTPClient)
+
+
+def get_cache_path(key: str) -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "googlesheets" / f"{key}.json"
+
+
+def read_cache(path: Path, modified: str, ttl: float) -> dict[str, object]:
+    """Return the cache entry, or an empty one if it is stale or missing.
+
+    An entry is stale if the spreadsheet was modified since it was written,
+    or if it is older than the TTL.
+    """
+    try:
+        cache = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
 
-    client = gspread.authorize(credentials)
-    spreadsheet = client.open_by_url(args.location)
-    worksheets = spreadsheet.worksheets()
+    if cache.get("modified") != modified:
+        return {}
 
-    for sheet in worksheets:
+    if time.time() - cache.get("created", 0) > ttl:
+        return {}
+
+    return cache
+
+
+def write_cache(path: Path, cache: dict[str, object]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=path.parent, delete=False) as io:
+        json.dump(cache, io)
+    os.replace(io.name, path)
+
+
+def fetch_cells(
+    session: requests.Session,
+    location: str,
+    paths: list[tuple[re.Pattern[str], str, type]],
+    ttl: float = CACHE_TTL,
+    refresh: bool = False,
+) -> list[dict[str, object]]:
+    """Fetch the first matching cell of every worksheet in batched requests.
+
+    Worksheet titles and cell values are cached per spreadsheet, keyed by
+    worksheet and cell. The cache is validated against the modification time
+    from the Drive API, so an unchanged spreadsheet costs a single request.
+
+    Requests go through the shared session, but with a client of their own,
+    since the client keeps the backoff state of its retries.
+    """
+    http = gspread.BackOffHTTPClient(None, session=session)
+    key = extract_id_from_url(location)
+    cache_path = get_cache_path(key)
+    modified = http.get_file_drive_metadata(key)["modifiedTime"]
+    cache = {} if refresh else read_cache(cache_path, modified, ttl)
+    stale = not cache
+
+    if stale:
+        metadata = http.fetch_sheet_metadata(key)
+        titles = [sheet["properties"]["title"] for sheet in metadata["sheets"]]
+        cache = {
+            "modified": modified,
+            "created": time.time(),
+            "sheets": titles,
+            "cells": {},
+        }
+
+    cells = []
+    for title in cache["sheets"]:
         for pattern, path, type in paths:
-            if pattern.match(sheet.title):
-                cell = sheet.acell(path)
-                value = type(cell.value)
-                result = {"sheet": sheet.title, "value": value}
-                print(json.dumps(result))
+            if pattern.match(title):
+                cells.append((absolute_range_name(title, path), title, type))
                 break
 
+    missing = [name for name, _, _ in cells if name not in cache["cells"]]
+    for start in range(0, len(missing), BATCH_SIZE):
+        ranges = missing[start : start + BATCH_SIZE]
+        response = http.values_batch_get(key, ranges)
+        for name, data in zip(ranges, response["valueRanges"]):
+            values = data.get("values") or [[None]]
+            cache["cells"][name] = values[0][0]
+
+    if stale or missing:
+        write_cache(cache_path, cache)
+
+    return [
+        {"sheet": title, "value": type(cache["cells"][name])}
+        for name, title, type in cells
+    ]
+
+
+def main() -> None:
+    args = parse_args()
+    paths = [parse_path(path) for path in args.paths]
+    locations = list(args.locations)
+    if args.file:
+        locations += [line.strip() for line in args.file if line.strip()]
+
+    client = authorize(args)
+    failed = False
+
+    with ThreadPoolExecutor(args.jobs) as executor:
+        futures = {
+            executor.submit(
+                fetch_cells,
+                client.http_client.session,
+                location,
+                paths,
+                ttl=args.ttl,
+                refresh=args.refresh,
+            ): location
+            for location in locations
+        }
+        for future in as_completed(futures):
+            location = futures[future]
+            try:
+                results = future.result()
+            except (
+                GSpreadException,
+                requests.RequestException,
+                KeyError,
+                TypeError,
+                ValueError,
+            ) as error:
+                message = str(error) or type(error).__name__
+                print(f"{location}: {message}", file=sys.stderr)
+                failed = True
+                continue
+
+            for result in results:
+                if len(locations) > 1:
+                    result = {"spreadsheet": location, **result}
+                print(json.dumps(result), flush=True)
+
+    if failed:
+        sys.exit(1)
+
 
 __pyproject__ = """
 [project]
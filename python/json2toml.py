@@ -2,9 +2,69 @@
 # /// script
 # dependencies = ["tomli-w"]
 # ///
+import argparse
+import hashlib
 import json
 import sys
+from pathlib import Path
+
 import tomli_w
 
+MANIFEST = ".json2toml-manifest.json"
+
+
+def sync(source: Path, target: Path) -> bool:
+    """Convert every *.json file below source to *.toml below target.
+
+    The target directory holds a manifest of source hashes, so files that
+    haven't changed since the last run are skipped. Outputs of deleted
+    sources are removed. Files that fail to convert are reported on stderr
+    and left out of the manifest, so they are retried on the next run.
+    Returns False if any file failed.
+    """
+    manifest = target / MANIFEST
+    try:
+        previous = json.loads(manifest.read_text())
+    except (OSError, ValueError):
+        previous = {}
+
+    digests = {}
+    failed = set()
+    for file in sorted(source.rglob("*.json")):
+        if file.name in (MANIFEST, ".toml2json-manifest.json"):
+            continue
+        name = file.relative_to(source).as_posix()
+        output = target / Path(name).with_suffix(".toml")
+        try:
+            data = file.read_bytes()
+            digest = hashlib.sha256(data).hexdigest()
+            if previous.get(name) != digest or not output.exists():
+                output.parent.mkdir(parents=True, exist_ok=True)
+                output.write_text(tomli_w.dumps(json.loads(data)))
+        except (OSError, TypeError, ValueError) as error:
+            print(f"{file}: {error}", file=sys.stderr)
+            failed.add(name)
+            continue
+        digests[name] = digest
+
+    for name in previous.keys() - digests.keys() - failed:
+        (target / Path(name).with_suffix(".toml")).unlink(missing_ok=True)
+
+    target.mkdir(parents=True, exist_ok=True)
+    manifest.write_text(json.dumps(digests, indent=2, sort_keys=True))
+    return not failed
+
+
 if __name__ == "__main__":
-    tomli_w.dump(json.load(sys.stdin), sys.stdout.buffer)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", nargs="?", type=Path)
+    parser.add_argument("target", nargs="?", type=Path)
+    args = parser.parse_args()
+
+    if args.source is not None and not args.source.is_dir():
+        parser.error(f"{args.source} is not a directory")
+
+    if args.source is None:
+        tomli_w.dump(json.load(sys.stdin), sys.stdout.buffer)
+    elif not sync(args.source, args.target or args.source):
+        sys.exit(1)
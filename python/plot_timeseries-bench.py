@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Compare the line-by-line and vectorized input parsing of plot_timeseries.
+
+Also check that chunked aggregation gives the same buckets as in memory.
+"""
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import plot_timeseries  # noqa: E402
+
+
+def read_data_python(file):
+    """Parse the input line by line, like plot_timeseries used to."""
+    data = []
+    for line in file:
+        timestamp, *value = line.strip().split()
+        if value:
+            data.append((timestamp, float(value[0])))
+        else:
+            data.append((timestamp, 1))
+
+    df = pd.DataFrame(data, columns=["timestamp", "value"])
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True).dt.tz_localize(None)
+    return df.set_index(pd.DatetimeIndex(df["timestamp"]))
+
+
+def generate(lines: int) -> str:
+    timestamps = pd.date_range("2024-01-01", periods=lines, freq="1s")
+    return "".join(
+        f"{timestamp:%Y-%m-%dT%H:%M:%SZ}" + (f" {n % 7}\n" if n % 3 else "\n")
+        for n, timestamp in enumerate(timestamps)
+    )
+
+
+def measure(read, text: str, lines: int) -> tuple[float, pd.DataFrame]:
+    start = time.perf_counter()
+    data = read(io.StringIO(text))
+    return lines / (time.perf_counter() - start), data
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", "-n", type=int, default=1_000_000)
+    parser.add_argument("--chunksize", type=int, default=10_000)
+    parser.add_argument("--windows", nargs="+", default=["1h", "1D", "2D", "7D"])
+    args = parser.parse_args()
+
+    text = generate(args.lines)
+    results = {
+        "python": measure(read_data_python, text, args.lines),
+        "vectorized": measure(plot_timeseries.read_data, text, args.lines),
+    }
+
+    expected = results["python"][1]
+    for name, (rate, data) in results.items():
+        same = (data["value"] == expected["value"]).all() and (
+            data.index == expected.index
+        ).all()
+        print(f"{name:<10} {rate:>12,.0f} lines/s {'' if same else '(mismatch)'}")
+
+    for window in args.windows:
+        expected = plot_timeseries.aggregate_data(results["vectorized"][1], window)
+        chunks = plot_timeseries.read_data(io.StringIO(text), args.chunksize)
+        data = plot_timeseries.aggregate_chunks(chunks, window)
+        same = data.equals(expected)
+        print(f"chunked {window:<10} {'same' if same else 'mismatch'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,6 @@
+import argparse
 import sys
-import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.dates import DateFormatter
-from pandas.tseries.frequencies import to_offset
+import warnings
 
 __pyproject__ = """
 [project]
@@ -18,42 +16,241 @@ requires = ["hatchling"]
 build-backend = "hatchling.build"
 """
 
+SPARKS = "▁▂▃▄▅▆▇█"
+
+
+def read_data(file, chunksize=None):
+    """Read "timestamp [value]" lines, where the value defaults to 1.
+
+    The lines are parsed by the C engine of pandas, with explicit dtypes.
+    With a chunksize, an iterator of data frames is returned instead.
+    """
+    import pandas as pd
+
+    reader = pd.read_csv(
+        file,
+        sep=r"\s+",
+        header=None,
+        names=["timestamp", "value"],
+        index_col=False,
+        dtype={"timestamp": object, "value": "float64"},
+        engine="c",
+        chunksize=chunksize,
+    )
+    if chunksize is None:
+        return prepare_data(reader)
+    return map(prepare_data, reader)
 
-def read_data(file):
-    data = []
-    for line in file:
-        timestamp, *value = line.strip().split()
-        if value:
-            data.append((timestamp, float(value[0])))
-        else:
-            data.append((timestamp, 1))
 
-    df = pd.DataFrame(data, columns=["timestamp", "value"])
-    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True).dt.tz_localize(None)
+def prepare_data(df):
+    import pandas as pd
+
+    df["value"] = df["value"].fillna(1)
+    df["timestamp"] = parse_timestamps(df["timestamp"])
     return df.set_index(pd.DatetimeIndex(df["timestamp"]))
 
 
+def parse_timestamps(timestamps):
+    """Parse ISO 8601 timestamps into naive UTC datetimes.
+
+    Timestamps in UTC ("Z") or without offset are parsed by numpy, which is
+    several times faster than pandas. Anything else, such as timestamps with
+    other UTC offsets, goes through pandas. So do strings that don't start with
+    an ISO 8601 date, since numpy also accepts numbers like 1700000000.
+    """
+    import pandas as pd
+
+    try:
+        with warnings.catch_warnings():
+            # numpy warns about, but accepts, timestamps with UTC offsets.
+            warnings.simplefilter("error")
+            values = timestamps.str.removesuffix("Z").to_numpy(dtype=str)
+            if is_iso_date(values):
+                values = values.astype("datetime64[ns]")
+                return pd.Series(values, index=timestamps.index)
+    except (ValueError, TypeError, UserWarning, DeprecationWarning):
+        pass
+
+    return pd.to_datetime(timestamps, utc=True).dt.tz_localize(None)
+
+
+def is_iso_date(values):
+    """Return True if every string starts with a date shaped like YYYY-MM-DD."""
+    chars = values.astype("U10").view("U1").reshape(-1, 10)
+    return bool((chars[:, [4, 7]] == "-").all())
+
+
 def aggregate_data(data, freq):
     return data.resample(freq).agg({"value": "sum"})
 
 
-def plot_data(data, window):
+def aggregate_chunks(chunks, freq):
+    """Resample chunks into partial sums and merge them bucket by bucket.
+
+    Memory depends on the number of buckets, not the number of events. Bins
+    are anchored at midnight of the first day in the first chunk, which
+    gives the same buckets as `aggregate_data` for sorted input.
+    """
+    import pandas as pd
+    from pandas.tseries.frequencies import to_offset
+
+    # Days are not Ticks as of pandas 3, and resampling ignores their origin.
+    # They are fixed durations on naive timestamps, so use a Timedelta.
+    if isinstance(offset := to_offset(freq), pd.offsets.Day):
+        freq = pd.Timedelta(days=offset.n)
+
+    # Fixed durations need a common origin. Calendar frequencies like weeks or
+    # months are anchored already.
+    anchored = not isinstance(to_offset(freq), pd.offsets.Tick)
+    total, options = None, {}
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        if total is None and not anchored:
+            options["origin"] = chunk.index.min().normalize()
+        partial = chunk[["value"]].resample(freq, **options).sum()
+        total = partial if total is None else total.add(partial, fill_value=0)
+
+    if total is None:
+        return pd.DataFrame({"value": []}, index=pd.DatetimeIndex([]))
+    return total.resample(freq, **options).sum()
+
+
+def decimate(data, width):
+    """Reduce the buckets to the minimum and maximum of each pixel column.
+
+    The buckets are split into `width` consecutive groups, and only the
+    smallest and largest bucket of each group is kept, so peaks survive.
+    """
+    import numpy as np
+
+    if len(data) <= 2 * width:
+        return data
+
+    values = data["value"].reset_index(drop=True)
+    groups = values.groupby(np.arange(len(values)) * width // len(values))
+    keep = np.union1d(groups.idxmin().to_numpy(), groups.idxmax().to_numpy())
+    return data.iloc[keep]
+
+
+def plot_data(data, window, output=None, line_threshold=None, decimation=True):
+    import matplotlib
+
+    if output is not None:
+        matplotlib.use("Agg")
+
+    import matplotlib.pyplot as plt
+    from matplotlib.dates import DateFormatter
+
     fig, ax = plt.subplots()
-    ax.bar(data.index, data["value"])
+    if decimation:
+        data = decimate(data, round(fig.get_figwidth() * fig.dpi))
+
+    if line_threshold is not None and len(data) > line_threshold:
+        ax.plot(data.index, data["value"])
+    else:
+        ax.bar(data.index, data["value"])
     ax.set_xlabel("Date")
     ax.set_ylabel("Value")
     ax.set_title(f"Time Series (Aggregated by {window})")
     ax.xaxis.set_major_formatter(DateFormatter("%Y-%m-%d %H:%M:%S"))
     fig.autofmt_xdate()
-    plt.show()
+
+    if output is not None:
+        fig.savefig(output)
+    else:
+        plt.show()
+
+
+def format_value(value):
+    """Format a sum without losing digits, and without ".0" for whole numbers."""
+    return str(int(value)) if value.is_integer() else str(value)
+
+
+def print_table(data, sep):
+    if sep:
+        print(f"timestamp{sep}value")
+    for timestamp, value in data["value"].items():
+        if sep:
+            print(f"{timestamp.isoformat()}{sep}{format_value(value)}")
+        else:
+            print(f"{timestamp.isoformat():<19} {format_value(value):>12}")
+
+
+def print_sparkline(data):
+    values = data["value"].tolist()
+    if not values:
+        return
+
+    # Scale from the smallest to the largest value, including zero.
+    low, high = min(0, *values), max(0, *values)
+    span = (high - low) or 1
+    line = "".join(
+        SPARKS[round((value - low) / span * (len(SPARKS) - 1))] for value in values
+    )
+    print(f"{data.index[0].isoformat()} {line} {data.index[-1].isoformat()}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Aggregate 'timestamp [value]' lines from stdin and plot them."
+    )
+    parser.add_argument("window", help="aggregation window, e.g. 1h or 1D")
+    parser.add_argument(
+        "--format",
+        "-f",
+        choices=["plot", "table", "csv", "sparkline"],
+        default="plot",
+        help="plot the buckets, or print them as a table, CSV or sparkline",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        metavar="FILE",
+        help="save the plot to FILE (e.g. PNG or SVG) instead of showing it",
+    )
+    parser.add_argument(
+        "--line-threshold",
+        type=int,
+        default=1000,
+        metavar="N",
+        help="plot a line instead of bars above N buckets (default: 1000)",
+    )
+    parser.add_argument(
+        "--no-decimate",
+        action="store_true",
+        help="plot every bucket instead of the extremes per pixel column",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        metavar="LINES",
+        help="read and aggregate the input in chunks of LINES, in bounded memory",
+    )
+    args = parser.parse_args()
+    if args.output is not None and args.format != "plot":
+        parser.error("--output requires --format=plot")
+    return args
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python plot_timeseries.py <aggregation_window>")
-        sys.exit(1)
-
-    window = sys.argv[1]
-    data = read_data(sys.stdin)
-    data = aggregate_data(data, window)
-    plot_data(data, window)
+    args = parse_args()
+    if args.chunksize:
+        data = aggregate_chunks(read_data(sys.stdin, args.chunksize), args.window)
+    else:
+        data = aggregate_data(read_data(sys.stdin), args.window)
+
+    if args.format == "table":
+        print_table(data, sep="")
+    elif args.format == "csv":
+        print_table(data, sep=",")
+    elif args.format == "sparkline":
+        print_sparkline(data)
+    else:
+        plot_data(
+            data,
+            args.window,
+            args.output,
+            line_threshold=args.line_threshold,
+            decimation=not args.no_decimate,
+        )
@@ -1,5 +1,122 @@
 #!/usr/bin/env python3
+import argparse
+import codecs
+import json
 import sys
-from urllib.parse import unquote_plus
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from urllib.parse import parse_qsl, unquote_to_bytes, urlsplit
 
-sys.stdout.write(unquote_plus(sys.stdin.read()))
+CHUNK_SIZE = 1 << 16
+BATCH_SIZE = 10_000
+
+
+def decode(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Decode URL-encoded data like `unquote_plus`, one chunk at a time.
+
+    A `%XX` escape or UTF-8 sequence split across chunks is carried over to
+    the next chunk. An escape cannot span a newline, so a chunk that ends a
+    line is decoded in full.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = b""
+    for chunk in chunks:
+        data = pending + chunk
+        cut = data.rfind(b"%", max(len(data) - 2, 0))
+        if cut == -1 or b"\n" in data[cut:]:
+            pending = b""
+        else:
+            data, pending = data[:cut], data[cut:]
+        yield decoder.decode(unquote_to_bytes(data.replace(b"+", b" ")))
+    yield decoder.decode(unquote_to_bytes(pending.replace(b"+", b" ")), final=True)
+
+
+def is_url(line: str) -> bool:
+    """Return True if the line is a URL or path rather than a bare query string.
+
+    A `?` may appear unescaped in a query string, so it only starts a query if
+    it comes before the first `=`.
+    """
+    if "://" in line or line.startswith("/"):
+        return True
+    question, equals = line.find("?"), line.find("=")
+    return question != -1 and (equals == -1 or question < equals)
+
+
+def parse_query(line: str) -> dict[str, str | list[str]]:
+    """Return the decoded parameters of a URL or query string.
+
+    Repeated keys are collected into lists.
+    """
+    line = line.strip()
+    if is_url(line):
+        line = urlsplit(line).query
+    data: dict[str, str | list[str]] = {}
+    for key, value in parse_qsl(line, keep_blank_values=True):
+        if key not in data:
+            data[key] = value
+        elif isinstance(previous := data[key], list):
+            previous.append(value)
+        else:
+            data[key] = [previous, value]
+    return data
+
+
+def parse_batch(lines: list[str]) -> str:
+    return "".join(json.dumps(parse_query(line)) + "\n" for line in lines)
+
+
+def parse_lines(lines: Iterable[str], jobs: int, batch_size: int) -> Iterator[str]:
+    """Parse lines into JSON lines, in batches across a process pool."""
+    lines = iter(lines)
+    batches = iter(lambda: list(islice(lines, batch_size)), [])
+    if jobs <= 1:
+        yield from map(parse_batch, batches)
+        return
+
+    with ProcessPoolExecutor(jobs) as executor:
+        pending: deque[Future[str]] = deque()
+        for batch in batches:
+            pending.append(executor.submit(parse_batch, batch))
+            if len(pending) > 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--lines", "-l", action="store_true", help="decode and flush line by line"
+    )
+    parser.add_argument(
+        "--query",
+        "-q",
+        action="store_true",
+        help="print the parameters of each URL or query string as a JSON line",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        metavar="N",
+        help="with --query, parse lines using N processes",
+    )
+    args = parser.parse_args()
+
+    if args.query:
+        batch_size = 1 if args.lines else BATCH_SIZE
+        output = parse_lines(sys.stdin, args.jobs, batch_size)
+    elif args.lines:
+        output = decode(iter(sys.stdin.buffer.readline, b""))
+    else:
+        output = decode(iter(partial(sys.stdin.buffer.read, CHUNK_SIZE), b""))
+
+    for text in output:
+        sys.stdout.write(text)
+        if args.lines:
+            sys.stdout.flush()
@@ -7,10 +7,23 @@
 # ///
 import argparse
 import decimal
+import hashlib
 import json
+import os
+import pickle
+import sys
+import tempfile
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+from xml.etree import ElementTree
 
 import xmlschema
 
+SCHEMA: xmlschema.XMLSchema | None = None
+
 
 class DecimalEncoder(json.JSONEncoder):
     def default(self, o: object) -> object:
@@ -19,19 +32,222 @@ class DecimalEncoder(json.JSONEncoder):
         return super().default(o)
 
 
+def get_cache_dir() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "xml2json"
+
+
+def hash_file(path: Path) -> str | None:
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def iter_schema_files(schema: xmlschema.XMLSchema) -> Iterator[Path]:
+    """Yield the local files of the schema and everything it includes or imports."""
+    for component in schema.maps.iter_schemas():
+        if component.url and (url := urlparse(component.url)).scheme == "file":
+            yield Path(url2pathname(url.path))
+
+
+def load_schema(path: str) -> xmlschema.XMLSchema:
+    """Build a schema, or load it from the cache if none of its files changed.
+
+    Cache entries are keyed by the schema file and its contents. Each entry
+    records the hashes of all included and imported files, which are checked
+    before the cached schema is used.
+    """
+    source = Path(path).resolve()
+    key = hashlib.sha256(
+        f"{xmlschema.__version__}:{source}:{hash_file(source)}".encode()
+    ).hexdigest()
+    cache = get_cache_dir() / f"{key}.pickle"
+
+    try:
+        with cache.open("rb") as io:
+            digests, schema = pickle.load(io)
+        if all(hash_file(Path(file)) == digest for file, digest in digests.items()):
+            return schema
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        pass
+
+    schema = xmlschema.XMLSchema(path)
+    digests = {str(file): hash_file(file) for file in iter_schema_files(schema)}
+
+    try:
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=cache.parent, delete=False) as io:
+            pickle.dump((digests, schema), io)
+        os.replace(io.name, cache)
+    except OSError:
+        pass
+
+    return schema
+
+
+def resolve_path(path: str, namespaces: dict[str, str]) -> list[str]:
+    """Split an absolute path into element tags, expanding namespace prefixes."""
+    tags = []
+    for step in path.strip("/").split("/"):
+        prefix, _, name = step.rpartition(":")
+        namespace = namespaces.get(prefix, "")
+        tags.append(f"{{{namespace}}}{name}" if namespace and name != "*" else name)
+    return tags
+
+
+def stream(file: str, path: str, schema: xmlschema.XMLSchema | None) -> None:
+    """Decode the elements matching an absolute path one at a time.
+
+    Every element is detached from its parent once it has been parsed and, if
+    it matches, decoded. Memory use depends on the size of the elements, not
+    on the size of the document.
+    """
+    resource = xmlschema.XMLResource(file, lazy=True)
+    namespaces = resource.get_namespaces()
+    if schema is None:
+        schema = xmlschema.XMLSchema(xmlschema.fetch_schema(resource))
+
+    tags = resolve_path(path, namespaces)
+    decoders: dict[str, xmlschema.XsdElement] = {}
+    ancestors: list[ElementTree.Element] = []
+
+    for event, elem in ElementTree.iterparse(file, events=("start", "end")):
+        if event == "start":
+            ancestors.append(elem)
+            continue
+
+        ancestors.pop()
+        depth = len(ancestors)
+        if depth + 1 == len(tags) and all(
+            tag in ("*", node.tag) for tag, node in zip(tags, [*ancestors, elem])
+        ):
+            if elem.tag not in decoders:
+                decoder = schema.get_element(elem.tag, path, namespaces)
+                if decoder is None:
+                    raise xmlschema.XMLSchemaValueError(
+                        f"{path}: no schema element for {elem.tag}"
+                    )
+                decoders[elem.tag] = decoder
+            data = decoders[elem.tag].decode(elem, validation="strict")
+            print(json.dumps(data, cls=DecimalEncoder), flush=True)
+
+        if 0 < depth < len(tags):
+            ancestors[-1].remove(elem)
+
+
+def iter_sources(paths: list[str]) -> Iterator[tuple[Path, Path]]:
+    """Yield each XML file with its output path, relative to the output directory.
+
+    Directories are searched recursively for `*.xml` files.
+    """
+    for path in map(Path, paths):
+        if path.is_dir():
+            for file in sorted(path.rglob("*.xml")):
+                yield file, file.relative_to(path).with_suffix(".json")
+        else:
+            yield path, Path(path.name).with_suffix(".json")
+
+
+def init_worker(schema: str | None) -> None:
+    global SCHEMA
+    SCHEMA = load_schema(schema) if schema else None
+
+
+def describe_error(error: Exception) -> str:
+    """Return a one-line message, without the schema dump of validation errors."""
+    message = getattr(error, "reason", None) or str(error).strip()
+    message = message.splitlines()[0] if message else type(error).__name__
+    if path := getattr(error, "path", None):
+        message += f" (at {path})"
+    return message
+
+
+def convert(file: Path) -> tuple[str | None, str | None]:
+    """Return the JSON document for a file, or an error message."""
+    try:
+        if SCHEMA is not None:
+            data = SCHEMA.to_dict(file)
+        else:
+            data = xmlschema.to_dict(file)
+    except (OSError, SyntaxError, ValueError, xmlschema.XMLSchemaException) as error:
+        return None, describe_error(error)
+    return json.dumps(data, cls=DecimalEncoder), None
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
-    parser.add_argument("file")
+    parser.add_argument("files", nargs="+", metavar="file")
     parser.add_argument("--schema")
+    parser.add_argument(
+        "--stream",
+        metavar="PATH",
+        help="print one JSON line per element matching PATH, in constant memory",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        metavar="N",
+        help="convert files using N processes",
+    )
+    parser.add_argument(
+        "--output-dir",
+        "-d",
+        type=Path,
+        metavar="DIR",
+        help="write one JSON file per input to DIR instead of JSON lines",
+    )
     args = parser.parse_args()
 
-    if args.schema:
-        schema = xmlschema.XMLSchema(args.schema)
-        data = schema.to_dict(args.file)
+    if args.stream:
+        if len(args.files) > 1 or Path(args.files[0]).is_dir():
+            parser.error("--stream requires a single file")
+        schema = load_schema(args.schema) if args.schema else None
+        stream(args.files[0], args.stream, schema)
+        return
+
+    failed = False
+    sources: list[tuple[Path, Path]] = []
+    outputs: dict[Path, Path] = {}
+    for file, output in iter_sources(args.files):
+        if args.output_dir and (other := outputs.get(output)):
+            print(f"{file}: {output} is already the output of {other}", file=sys.stderr)
+            failed = True
+            continue
+        outputs[output] = file
+        sources.append((file, output))
+
+    files = [file for file, _ in sources]
+
+    if args.jobs > 1:
+        executor = ProcessPoolExecutor(
+            args.jobs, initializer=init_worker, initargs=(args.schema,)
+        )
+        results = executor.map(convert, files, chunksize=8)
     else:
-        data = xmlschema.to_dict(args.file)
+        executor = None
+        init_worker(args.schema)
+        results = map(convert, files)
+
+    try:
+        for (file, output), (document, error) in zip(sources, results):
+            if error is not None:
+                print(f"{file}: {error}", file=sys.stderr)
+                failed = True
+            elif args.output_dir:
+                path = args.output_dir / output
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(document + "\n")
+            else:
+                print(document, flush=True)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
 
-    print(json.dumps(data, cls=DecimalEncoder))
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":